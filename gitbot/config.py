@@ -1,5 +1,6 @@
 import logging
 import os
+import shutil
 
 LOGGING_LEVEL = os.environ.get("LOGGING_LEVEL", logging.INFO)
 logger = logging.getLogger(__name__)
@@ -7,7 +8,7 @@ logger.setLevel(LOGGING_LEVEL)
 
 
 def fetch_secret(client: "secretmanager.SecretManagerService", uri: str) -> str:
-    logger.info(f"Grabbing secret from {uri}")
+    logger.info("Grabbing secret from %s", uri)
     return client.access_secret_version(name=uri).payload.data.decode("UTF-8")
 
 
@@ -22,6 +23,10 @@ COMMITTER_NAME = "Sentry Bot"
 COMMITTER_EMAIL = "bot@sentry.io"
 # Used in Github Sentry PRs to sync a getsentry branch
 GITBOT_MARKER = "#sync-getsentry"
+# Github caps webhook payloads at 25MB; anything larger is not from them
+MAX_CONTENT_LENGTH = 25 * 1024 * 1024
+# Real pull_request events are tens of KBs; larger ones are not worth parsing
+MAX_PULL_REQUEST_CONTENT_LENGTH = 1_000_000
 
 # App behaviour
 DRY_RUN = os.environ.get("DRY_RUN", "False") == "True"
@@ -64,3 +69,11 @@ SENTRY_CHECKOUT_PATH = "/tmp/sentry"
 SENTRY_REPO = os.environ.get("SENTRY_REPO", "getsentry/sentry-test-repo")
 SENTRY_REPO_UPSTREAM = os.environ.get("SENTRY_REPO_UPSTREAM", "getsentry/sentry")
 SENTRY_REPO_URL = repo_url(SENTRY_REPO)
+# Reverts happen in worktrees of the primary checkouts rather than in fresh clones
+WORKTREES_PATH = "/tmp/gitbot-worktrees"
+# Short-lived checkouts go to tmpfs when it is big enough (Docker only gives it 64MB)
+SCRATCH_PATH = (
+    "/dev/shm"
+    if os.path.isdir("/dev/shm") and shutil.disk_usage("/dev/shm").free > 2 * 1024**3
+    else None
+)
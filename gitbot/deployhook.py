@@ -4,13 +4,13 @@ import hmac
 import hashlib
 import logging
 import os
-import tempfile
-from operator import itemgetter
+import threading
 from typing import Any
 
+import orjson
 import sentry_sdk
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, abort, g, request
 from sentry_sdk.integrations.flask import FlaskIntegration
 
 from gitbot.config import (
@@ -27,6 +27,8 @@ from gitbot.config import (
     GITHUB_WEBHOOK_SECRET,
     IS_DEV,
     LOGGING_LEVEL,
+    MAX_CONTENT_LENGTH,
+    MAX_PULL_REQUEST_CONTENT_LENGTH,
     SENTRY_CHECKOUT_PATH,
     SENTRY_REPO,
     SENTRY_REPO_UPSTREAM,
@@ -37,6 +39,7 @@ from gitbot.lib import (
     bump_version,
     run,
     update_checkout,
+    worktree,
 )
 
 logging.basicConfig(
@@ -47,11 +50,18 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# gunicorn halts when a worker exits with this code (Arbiter.WORKER_BOOT_ERROR)
+# Any other exit code makes it respawn the worker, which would boot and fail again
+WORKER_BOOT_ERROR = 3
+
+# Set once the primary repos are cloned/updated; requests needing them get a 503 until then
+primary_repos_ready = threading.Event()
+
 
 def boot() -> None:
     if ENV != "development":
-        logger.info(f"Environment: {ENV}")
-        logger.info(f"Release: {os.environ['RELEASE']}")
+        logger.info("Environment: %s", ENV)
+        logger.info("Release: %s", os.environ["RELEASE"])
         sentry_sdk.init(
             dsn="https://95cc5cfe034b4ff8b68162078978935c@o1.ingest.sentry.io/5748916",
             integrations=[FlaskIntegration()],
@@ -81,19 +91,36 @@ def boot() -> None:
     os.environ["GIT_AUTHOR_NAME"] = COMMITTER_NAME
 
     # This clones/updates the primary repos under /tmp
-    if not os.environ.get("FAST_STARTUP"):
-        update_primary_repo("sentry")
-        update_primary_repo("getsentry")
+    # It happens in the background so the web server can start answering right away
+    if os.environ.get("FAST_STARTUP"):
+        primary_repos_ready.set()
+    else:
+        threading.Thread(target=update_primary_repos, daemon=True).start()
 
     if DRY_RUN:
         logger.info("Dry run mode: on")
     else:
         logger.info("Dry run mode: *OFF* <--!")
         logger.info(
-            f"Code bumps will be pushed to {GETSENTRY_BRANCH} on {GETSENTRY_REPO}"
+            "Code bumps will be pushed to %s on %s", GETSENTRY_BRANCH, GETSENTRY_REPO
         )
 
 
+def update_primary_repos() -> None:
+    try:
+        update_primary_repo("sentry")
+        update_primary_repo("getsentry")
+        primary_repos_ready.set()
+    except Exception as e:
+        # The app cannot do anything without the primary repos. Rather than answering
+        # 503 forever, exit with the code that makes gunicorn shut down so the
+        # container gets restarted, as if boot() had failed synchronously
+        sentry_sdk.capture_exception(e)
+        logger.exception(e)
+        sentry_sdk.flush()
+        os._exit(WORKER_BOOT_ERROR)
+
+
 # Alias for updating the Sentry and Getsentry repos
 def update_primary_repo(repo: str) -> None:
     quiet = LOGGING_LEVEL != "debug"
@@ -103,25 +130,48 @@ def update_primary_repo(repo: str) -> None:
         update_checkout(GETSENTRY_REPO_URL, GETSENTRY_CHECKOUT_PATH, quiet)
 
 
-def respond(data: str | dict[str, Any], status_code: int) -> tuple[str, int]:
+def respond(
+    data: str | dict[str, Any], status_code: int, report: bool = True
+) -> Response:
     logger.info(data)
     if isinstance(data, str):
         data = {"reason": data}
-    if status_code != 200:
+    if status_code != 200 and report:
         sentry_sdk.capture_message(data["reason"], "fatal")
-    return jsonify(data), status_code
+    # orjson serializes straight to bytes; no need to go through jsonify
+    return Response(orjson.dumps(data), status=status_code, mimetype="application/json")
+
+
+def not_ready() -> Response:
+    # This is expected on every cold start; there is nothing to report to Sentry
+    msg = "The primary repos are still being set up."
+    return respond(msg, status_code=503, report=False)
+
+
+def _json() -> dict[str, Any]:
+    # Parse the body at most once per request; orjson is much faster than get_json()
+    if "body" not in g:
+        try:
+            g.body = orjson.loads(g.raw)
+        except orjson.JSONDecodeError:
+            abort(respond("Invalid JSON payload.", status_code=400))
+    return g.body
 
 
 # Github's UI looks really bad when most responses are 400
 # Let's only turn it red when something actually goes bad
-def process_pull_request() -> tuple[str, int]:
+def process_pull_request() -> Response:
     """Handle "pull_request" events from PRs with the deploy marker set"""
-    data = request.get_json()
-    logger.info(data)
+    if (request.content_length or 0) > MAX_PULL_REQUEST_CONTENT_LENGTH:
+        return respond("Payload too large.", status_code=200)
+
+    data = _json()
+    # The whole event is large; only dump it when debugging
+    logger.debug(data)
 
     action = data.get("action")
     if action not in ["synchronize", "opened"]:
-        logger.info(f"Action: '{action}' not in 'synchronize' or 'opened'")
+        logger.info("Action: '%s' not in 'synchronize' or 'opened'", action)
         return respond("Unsupported action for pull_request event.", status_code=200)
 
     # Check that the PR is from the same repo
@@ -146,7 +196,7 @@ def process_pull_request() -> tuple[str, int]:
         return respond("We do not support this for staging.", status_code=200)
 
     body = pull_request["body"] or ""
-    if body.find(GITBOT_MARKER) == -1:
+    if GITBOT_MARKER not in body:
         return respond("Deploy marker not found.", status_code=200)
 
     ref_sha = head["sha"]
@@ -159,93 +209,129 @@ def process_pull_request() -> tuple[str, int]:
     return respond("Commit not relevant for deploy sync.", status_code=200)
 
 
-def valid_payload(secret: str, payload: bytes, signature: str) -> bool:
-    # Validate payload signature
-    payload_signature = hmac.new(
-        secret.encode("utf-8"), payload, hashlib.sha1
-    ).hexdigest()
-    return hmac.compare_digest(payload_signature, signature)
+# Run the HMAC key schedule once; each request works on a copy of these
+_GITHUB_WEBHOOK_MAC = (
+    hmac.new(GITHUB_WEBHOOK_SECRET.encode("utf-8"), b"", hashlib.sha256)
+    if GITHUB_WEBHOOK_SECRET
+    else None
+)
+_GITBOT_API_MAC = (
+    hmac.new(GITBOT_API_SECRET.encode("utf-8"), b"", hashlib.sha256)
+    if GITBOT_API_SECRET
+    else None
+)
+
+
+def _signature(header: str) -> str:
+    # The header looks like "sha256=<hex digest>" (str.removeprefix needs Python 3.9)
+    prefix = "sha256="
+    value: str = request.headers.get(header, "")
+    return value[len(prefix) :] if value.startswith(prefix) else value
+
+
+def valid_payload(secret_mac: hmac.HMAC, payload: bytes, signature: str) -> bool:
+    # Validate payload signature by comparing the raw digest bytes
+    mac = secret_mac.copy()
+    mac.update(payload)
+    try:
+        signature_bytes = bytes.fromhex(signature)
+    except ValueError:
+        return False
+    return hmac.compare_digest(mac.digest(), signature_bytes)
 
 
 boot()
 app = Flask(__name__)
+app.config["MAX_CONTENT_LENGTH"] = MAX_CONTENT_LENGTH
+
+
+@app.before_request
+def read_body() -> None:
+    # The raw bytes are needed for the signature check and are parsed later by _json()
+    g.raw = request.get_data(cache=True)
 
 
 @app.route("/", methods=["POST"])
-def index() -> tuple[str, int]:
-    if GITHUB_WEBHOOK_SECRET and not valid_payload(
-        GITHUB_WEBHOOK_SECRET,
-        request.data,
-        str(request.headers.get("X-Hub-Signature", "").replace("sha1=", "")),
+def index() -> Response:
+    if _GITHUB_WEBHOOK_MAC and not valid_payload(
+        _GITHUB_WEBHOOK_MAC,
+        g.raw,
+        _signature("X-Hub-Signature-256"),
     ):
         return respond("Cannot validate payload signature.", status_code=403)
 
     event_type = request.headers.get("X-GitHub-Event")
 
     if event_type == "pull_request":
+        if not primary_repos_ready.wait(timeout=0.1):
+            return not_ready()
         return process_pull_request()
     else:
         return respond("Unsupported event type.", status_code=200)
 
 
-def process_git_revert() -> tuple[str, int]:
-    data = request.get_json()
-    repo, sha, name = itemgetter("repo", "sha", "name")(data)
+def process_git_revert() -> Response:
+    data = _json()
+    repo = data["repo"]
+    sha = data["sha"]
     name = data["name"]
-    logger.info(f"{name} has requested to revert {sha} from {repo}")
+    logger.info("%s has requested to revert %s from %s", name, sha, repo)
 
-    tmp_dir = tempfile.mkdtemp()
     repo_url = SENTRY_REPO_URL if repo == "sentry" else GETSENTRY_REPO_URL
     checkout = SENTRY_CHECKOUT_PATH if repo == "sentry" else GETSENTRY_CHECKOUT_PATH
 
-    # If there were multiple revert requests very close to each other there's a chance
-    # that more than one `git pull` would be executed at the same time
-    update_checkout(repo_url, checkout)
+    # Reverts are pushed on top of origin/master, thus, it has to be current rather
+    # than reusing a recent update (e.g. the one from a previous revert)
+    update_checkout(repo_url, checkout, debounce=False)
 
     # This avoids mutating the primary repo
-    run(f"git clone {checkout} {tmp_dir}")
-    execution = run(f'git log -1 --format="%s" {sha}', cwd=tmp_dir)
-    # "fix(search): Correct a few types on the frontend grammar parser (#26554)"
-    # "Revert "ref(snql) Update SDK to latest (#26638)""
-    subject = execution.stdout.replace('"', "")
-    if repo == "getsentry" and subject.startswith("getsentry/sentry@"):
-        msg = f"{sha} cannot be reverted because it needs to be reverted in Sentry"
-        return respond(msg, status_code=400)
-
-    run(f"git revert --no-commit {sha}", cwd=tmp_dir)
-    run(
-        [
-            "git",
-            "commit",
-            "-m",
-            f'Revert "{subject}"',
-            "-m",
-            f"This reverts commit {sha}.",
-            "-m",
-            f"Co-authored-by: {name}",
-        ],
-        cwd=tmp_dir,
-    )
-
-    # Since we cloned from a local checkout we need to make sure to push to the remote repo
-    push_args = f"git push {repo_url}"
-    if DRY_RUN:
-        push_args += " --dry-run"
-    run(push_args, cwd=tmp_dir)
-    revert_sha = run("git rev-parse origin/master", cwd=tmp_dir).stdout
+    with worktree(checkout) as worktree_path:
+        execution = run(f'git log -1 --format="%s" {sha}', cwd=worktree_path)
+        # "fix(search): Correct a few types on the frontend grammar parser (#26554)"
+        # "Revert "ref(snql) Update SDK to latest (#26638)""
+        subject = execution.stdout.replace('"', "")
+        if repo == "getsentry" and subject.startswith("getsentry/sentry@"):
+            msg = f"{sha} cannot be reverted because it needs to be reverted in Sentry"
+            return respond(msg, status_code=400)
+
+        run(f"git revert --no-commit {sha}", cwd=worktree_path)
+        run(
+            [
+                "git",
+                "commit",
+                "-m",
+                f'Revert "{subject}"',
+                "-m",
+                f"This reverts commit {sha}.",
+                "-m",
+                f"Co-authored-by: {name}",
+            ],
+            cwd=worktree_path,
+        )
+
+        # The worktree has a detached HEAD, thus, we need to name the remote branch
+        push_args = f"git push {repo_url} HEAD:master"
+        if DRY_RUN:
+            push_args += " --dry-run"
+        run(push_args, cwd=worktree_path)
+        revert_sha = run("git rev-parse HEAD", cwd=worktree_path).stdout
+
     body = {"reason": f"{sha} reverted.", "revert_sha": revert_sha}
     return respond(body, status_code=200)
 
 
 @app.route("/api/revert", methods=["POST"])
-def revert() -> tuple[str, int]:
-    if GITBOT_API_SECRET and not valid_payload(
-        GITBOT_API_SECRET,
-        request.data,
-        str(request.headers.get("X-Signature", "").replace("sha1=", "")),
+def revert() -> Response:
+    if _GITBOT_API_MAC and not valid_payload(
+        _GITBOT_API_MAC,
+        g.raw,
+        _signature("X-Signature"),
     ):
         return respond("Cannot validate payload signature.", status_code=403)
 
+    if not primary_repos_ready.wait(timeout=0.1):
+        return not_ready()
+
     try:
         return process_git_revert()
     except CommandError as e:
@@ -4,9 +4,12 @@ import contextlib
 import logging
 import os
 import shlex
+import shutil
 import subprocess
 import tempfile
-from typing import Any
+import threading
+import time
+from typing import Any, Iterator, Sequence
 
 from gitbot.config import (
     COMMITTER_EMAIL,
@@ -15,87 +18,155 @@ from gitbot.config import (
     GETSENTRY_REPO_URL,
     LOGGING_LEVEL,
     PAT,
+    SCRATCH_PATH,
     SENTRY_CHECKOUT_PATH,
     SENTRY_REPO_URL,
+    WORKTREES_PATH,
 )
 
 logger = logging.getLogger(__name__)
 logger.setLevel(LOGGING_LEVEL)
 
 
+# Commands we run on every update are tokenized once
+GIT_FETCH_MASTER = ("git", "fetch", "--quiet", "--no-tags", "origin", "master")
+GIT_RESET_MASTER = ("git", "reset", "--hard", "origin/master")
+
+
 class CommandError(Exception):
     pass
 
 
 def run(
-    cmd: str | list[str],
+    cmd: str | Sequence[str],
     cwd: str = "/tmp",
     quiet: bool = False,
     raise_error: bool = True,
 ) -> subprocess.CompletedProcess[str]:
+    new_cmd: Sequence[str]
     if isinstance(cmd, str):
         new_cmd = cmd.split()
         if ' "' in cmd:
             raise Exception(
                 f"The command {cmd} contains double quotes. Pass a list instead of a string."
             )
-    elif isinstance(cmd, list):
+    elif isinstance(cmd, (list, tuple)):
         new_cmd = cmd
     else:
-        raise TypeError(f"expected str/list got: {cmd=}")
+        raise TypeError(f"expected str/list/tuple got: {cmd=}")
 
     # GCR does not scrub the Personal Access Token from the output
     scrub_output = PAT and PAT not in new_cmd
-    if not quiet:
-        _command = "> "
-        for part in new_cmd:
-            if " " in part:
-                _command += f' "{part}"'
-            else:
-                _command += f" {part}"
-        _command += f" (cwd: {cwd})"
+    if not quiet and logger.isEnabledFor(logging.INFO):
+        command = " ".join(f'"{part}"' if " " in part else part for part in new_cmd)
         if scrub_output and PAT is not None:
-            _command = _command.replace(PAT, "<secret>")
-        logger.info(_command)
+            command = command.replace(PAT, "<secret>")
+        logger.info("> %s (cwd: %s)", command, cwd)
 
-    # Capture the output so you can process it later and to show up in Sentry
+    # Stream the output so it gets logged as it happens rather than buffering all of it
+    # Capture it as well so you can process it later and to show up in Sentry
     # Redirect stderr to stdout
-    execution = subprocess.run(
+    lines = []
+    with subprocess.Popen(
         new_cmd,
         cwd=cwd,
         stdout=subprocess.PIPE,
         stderr=subprocess.STDOUT,
         encoding="UTF-8",
-    )
-
-    output = ""
-    if execution.stdout:
-        for string in execution.stdout.splitlines():
+        errors="replace",
+    ) as process:
+        assert process.stdout is not None
+        for line in process.stdout:
+            line = line.rstrip()
             if scrub_output and PAT is not None:
-                string = string.replace(PAT, "<secret>")
-            output += f"{string}\n"
+                line = line.replace(PAT, "<secret>")
+            lines.append(line)
             if not quiet:
-                logger.info(string)
+                logger.info(line)
 
-    execution.stdout = output.strip()
+    output = "\n".join(lines).strip()
+    execution = subprocess.CompletedProcess(new_cmd, process.returncode, output)
     # If we raise an exception we will see it reported in Sentry and abort code execution
     if execution.returncode != 0 and raise_error:
         raise CommandError(output)
     return execution
 
 
-def update_checkout(repo_url: str, checkout_path: str, quiet: bool = False) -> None:
-    logger.info(f"About to clone/pull {repo_url} to {checkout_path}.")
-    if not os.path.exists(checkout_path):
-        # We clone before the app is running. Requests will clone from this checkout
-        run(f"git clone {repo_url} {checkout_path}", quiet=quiet)
-        # This silences some Git hints. This is the recommended default setting
-        run("git config pull.rebase false", cwd=checkout_path, quiet=quiet)
+# Requests arriving within this many seconds of an update reuse it
+UPDATE_DEBOUNCE_SECONDS = 5
+
+_checkout_locks: dict[str, threading.Lock] = {}
+_last_update: dict[str, float] = {}
+
+
+def update_checkout(
+    repo_url: str, checkout_path: str, quiet: bool = False, debounce: bool = True
+) -> None:
+    # Concurrent requests wait for one update rather than racing each other on index.lock
+    with _checkout_locks.setdefault(checkout_path, threading.Lock()):
+        last_update = _last_update.get(checkout_path)
+        if (
+            debounce
+            and last_update is not None  # noqa: W503
+            and time.monotonic() - last_update < UPDATE_DEBOUNCE_SECONDS  # noqa: W503
+        ):
+            logger.info("%s was just updated.", checkout_path)
+            return
+
+        logger.info("About to clone/pull %s to %s.", repo_url, checkout_path)
+        if not os.path.exists(checkout_path):
+            # We clone before the app is running. Requests will clone from this checkout
+            run(f"git clone {repo_url} {checkout_path}", quiet=quiet)
+
+        # Resetting to the fetched tip also covers the checkout being left in a bad state
+        run(GIT_FETCH_MASTER, cwd=checkout_path, quiet=quiet)
+        run(GIT_RESET_MASTER, cwd=checkout_path, quiet=quiet)
+        _last_update[checkout_path] = time.monotonic()
+
 
-    # In case it was left in a bad state
-    run("git fetch origin master", cwd=checkout_path, quiet=quiet)
-    run("git reset --hard origin/master", cwd=checkout_path, quiet=quiet)
-    run("git pull origin master", cwd=checkout_path, quiet=quiet)
+# Idle worktrees of each primary checkout, ready to be lent out
+_worktrees: dict[str, list[str]] = {}
+_worktrees_created: dict[str, int] = {}
+_worktrees_lock = threading.Lock()
+# Keeps concurrent `git worktree` commands on the same checkout from colliding
+_worktree_add_locks: dict[str, threading.Lock] = {}
+
+
+@contextlib.contextmanager
+def worktree(checkout_path: str) -> Iterator[str]:
+    """Lend a detached worktree of checkout_path reset to origin/master
+
+    Worktrees share the object database of the primary checkout, thus, this is much
+    cheaper than cloning it. A new worktree is only added if all others are in use.
+    """
+    # Only bookkeeping happens under the pool lock; adding a worktree takes a while
+    with _worktrees_lock:
+        idle = _worktrees.setdefault(checkout_path, [])
+        new = not idle
+        if new:
+            count = _worktrees_created.get(checkout_path, 0)
+            _worktrees_created[checkout_path] = count + 1
+            path = f"{WORKTREES_PATH}/{os.path.basename(checkout_path)}-{count}"
+        else:
+            path = idle.pop()
+
+    if new:
+        with _worktree_add_locks.setdefault(checkout_path, threading.Lock()):
+            # Remove leftovers from a previous run of the app
+            shutil.rmtree(path, ignore_errors=True)
+            run("git worktree prune", cwd=checkout_path)
+            run(
+                f"git worktree add --detach {path} origin/master",
+                cwd=checkout_path,
+            )
+
+    try:
+        # In case it was left in a bad state by a previous request
+        run(GIT_RESET_MASTER, cwd=path)
+        yield path
+    finally:
+        with _worktrees_lock:
+            _worktrees[checkout_path].append(path)
 
 
 def sync_with_upstream(checkout_path: str, upstream_url: str) -> None:
@@ -155,7 +226,7 @@ def bump_version(
             repo_root = temp_checkout
         else:
             # Once we exit the with statement the temporary directory witll be deleted
-            repo_root = ctx.enter_context(tempfile.TemporaryDirectory())
+            repo_root = ctx.enter_context(tempfile.TemporaryDirectory(dir=SCRATCH_PATH))
             repo_root = f"{repo_root}/getsentry"
 
         # The branch has to exist in the remote repo
@@ -171,8 +242,9 @@ def bump_version(
         # redist. dev environments.
         update_checkout(SENTRY_REPO_URL, sentry_path)
         try:
+            # --shared borrows the objects of the checkout instead of copying them
             run(
-                f"git clone --depth 1 -b master {sentry_path} {repo_root}/../sentry",
+                f"git clone --shared -b master {sentry_path} {repo_root}/../sentry",
             )
         except CommandError:
             return False, f"Cannot clone branch feat/frozen-dependencies from {sentry_path}."
@@ -186,7 +258,7 @@ def bump_version(
         except CommandError:
             execution = run("git show", cwd=repo_root)
             # e.g. https://github.com/getsentry/getsentry/pull/7672/commits
-            if execution.stdout.find(f"getsentry/sentry@{ref_sha}") > -1:
+            if f"getsentry/sentry@{ref_sha}" in execution.stdout:
                 logger.info("The developer has manually bumped the version.")
             else:
                 raise
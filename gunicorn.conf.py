@@ -0,0 +1,20 @@
+# Picked up automatically by gunicorn when started from the app's directory
+bind = ":8080"
+
+# Every request spends most of its time waiting on git subprocesses, thus, threads
+# let concurrent webhooks make progress without needing more CPU.
+# There must be a single worker: each worker runs boot() and update_checkout() only
+# serializes git operations within its own process.
+workers = 1
+threads = 8
+worker_class = "gthread"
+
+# In my experience this configuration hovers around 100 MB
+# baseline (noop app code) memory usage in Cloud Run.
+
+# 0 disables gunicorn's automatic worker restarting.
+# "Workers silent for more than this many seconds are killed and restarted."
+# Reverts and bumps clone and push big repos, so they can legitimately take minutes.
+timeout = 0
+
+# If things get bad you might want to set max_requests and max_requests_jitter.
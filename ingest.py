@@ -34,7 +34,7 @@ HOSTS = {
 
 def signature(secret: str, payload: dict[str, Any]) -> str:
     return hmac.new(
-        secret.encode("utf-8"), json.dumps(payload).encode("utf-8"), hashlib.sha1
+        secret.encode("utf-8"), json.dumps(payload).encode("utf-8"), hashlib.sha256
     ).hexdigest()
 
 
@@ -45,7 +45,7 @@ def revert_payload_header(
     header = {}
     if GITBOT_API_SECRET:
         sign = signature(GITBOT_API_SECRET, payload)
-        header["X-Signature"] = f"sha1={sign}"
+        header["X-Signature"] = f"sha256={sign}"
     return payload, header
 
 
@@ -68,7 +68,7 @@ def bump_payload_header(
     header = {}
     if GITHUB_WEBHOOK_SECRET:
         sign = signature(GITHUB_WEBHOOK_SECRET, payload)
-        header["X-Hub-Signature"] = f"sha1={sign}"
+        header["X-Hub-Signature-256"] = f"sha256={sign}"
         header["X-GitHub-Event"] = "push"
 
     return payload, header
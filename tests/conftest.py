@@ -0,0 +1,4 @@
+import os
+
+# Importing gitbot.deployhook boots the app; skip cloning the primary repos
+os.environ.setdefault("FAST_STARTUP", "1")
@@ -0,0 +1,33 @@
+from unittest.mock import patch
+
+from gitbot.deployhook import (
+    WORKER_BOOT_ERROR,
+    CommandError,
+    app,
+    primary_repos_ready,
+    update_primary_repos,
+)
+
+
+@patch("gitbot.deployhook.os._exit")
+@patch("gitbot.deployhook.update_primary_repo")
+def test_failing_to_update_primary_repos_exits(mock_update, mock_exit):
+    mock_update.side_effect = CommandError("fatal: Authentication failed")
+    primary_repos_ready.clear()
+    try:
+        update_primary_repos()
+        mock_exit.assert_called_once_with(WORKER_BOOT_ERROR)
+        assert not primary_repos_ready.is_set()
+    finally:
+        primary_repos_ready.set()
+
+
+@patch("gitbot.deployhook.sentry_sdk.capture_message")
+def test_not_ready_is_not_reported(mock_capture):
+    primary_repos_ready.clear()
+    try:
+        response = app.test_client().post("/api/revert", json={})
+        assert response.status_code == 503
+        mock_capture.assert_not_called()
+    finally:
+        primary_repos_ready.set()
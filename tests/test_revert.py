@@ -0,0 +1,42 @@
+from unittest.mock import patch
+
+from gitbot.deployhook import app
+from gitbot.lib import run
+
+git_commit = ["git", "-c", "user.name=Test", "-c", "user.email=test@example.com"]
+
+
+def test_back_to_back_reverts(tmpdir, monkeypatch):
+    monkeypatch.setenv("GIT_COMMITTER_NAME", "Sentry Bot")
+    monkeypatch.setenv("GIT_COMMITTER_EMAIL", "bot@sentry.io")
+    upstream = f"{tmpdir}/upstream.git"
+    seed = f"{tmpdir}/seed"
+    checkout = f"{tmpdir}/checkout"
+    run(f"git init --bare -b master {upstream}")
+    run(f"git clone {upstream} {seed}")
+    shas = []
+    for name in ("foo", "bar"):
+        run(f"touch {name}", cwd=seed)
+        run(f"git add {name}", cwd=seed)
+        run(git_commit + ["commit", "-m", f"Add {name}"], cwd=seed)
+        shas.append(run("git rev-parse HEAD", cwd=seed).stdout)
+    run("git push origin master", cwd=seed)
+    run(f"git clone {upstream} {checkout}")
+
+    with patch("gitbot.deployhook.SENTRY_REPO_URL", upstream), patch(
+        "gitbot.deployhook.SENTRY_CHECKOUT_PATH", checkout
+    ), patch("gitbot.deployhook.DRY_RUN", False), patch(
+        "gitbot.lib.WORKTREES_PATH", f"{tmpdir}/worktrees"
+    ), patch.dict(
+        "gitbot.lib._worktrees"
+    ), patch.dict(
+        "gitbot.lib._worktrees_created"
+    ):
+        client = app.test_client()
+        # The second revert has to start from the first one rather than a stale tip
+        for sha in reversed(shas):
+            payload = {"repo": "sentry", "sha": sha, "name": "Foo <foo@example.com>"}
+            response = client.post("/api/revert", json=payload)
+            assert response.status_code == 200
+            revert_sha = response.json["revert_sha"]
+            assert run("git rev-parse master", cwd=upstream).stdout == revert_sha
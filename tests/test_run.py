@@ -0,0 +1,14 @@
+import pytest
+
+from gitbot.lib import CommandError, run
+
+
+def test_run_output_is_stripped():
+    assert run(["printf", "foo\\nbar\\n\\n"], quiet=True).stdout == "foo\nbar"
+
+
+def test_run_raises_with_output():
+    with pytest.raises(CommandError, match="boom"):
+        run(["sh", "-c", "echo boom; exit 1"], quiet=True)
+
+    assert run(["sh", "-c", "exit 1"], raise_error=False).returncode == 1
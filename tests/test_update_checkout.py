@@ -0,0 +1,35 @@
+from unittest.mock import patch
+
+from gitbot.lib import UPDATE_DEBOUNCE_SECONDS, update_checkout
+
+
+@patch("gitbot.lib.time.monotonic")
+@patch("gitbot.lib.run")
+def test_update_checkout_is_debounced(mock_run, mock_monotonic, tmpdir):
+    checkout = str(tmpdir)
+    mock_monotonic.return_value = 1000.0
+    update_checkout("git@github.com:/getsentry/sentry", checkout)
+    calls = mock_run.call_count
+    assert calls > 0
+
+    # A request arriving right after reuses the previous update
+    mock_monotonic.return_value += UPDATE_DEBOUNCE_SECONDS - 1
+    update_checkout("git@github.com:/getsentry/sentry", checkout)
+    assert mock_run.call_count == calls
+
+    mock_monotonic.return_value += UPDATE_DEBOUNCE_SECONDS
+    update_checkout("git@github.com:/getsentry/sentry", checkout)
+    assert mock_run.call_count == 2 * calls
+
+
+@patch("gitbot.lib.time.monotonic")
+@patch("gitbot.lib.run")
+def test_update_checkout_without_debounce(mock_run, mock_monotonic, tmpdir):
+    checkout = str(tmpdir)
+    mock_monotonic.return_value = 1000.0
+    update_checkout("git@github.com:/getsentry/sentry", checkout)
+    calls = mock_run.call_count
+
+    # Reverts always need the latest tip
+    update_checkout("git@github.com:/getsentry/sentry", checkout, debounce=False)
+    assert mock_run.call_count == 2 * calls
@@ -0,0 +1,40 @@
+import hashlib
+import hmac
+
+from gitbot.deployhook import _signature, app, valid_payload
+
+payload = b'{"repo": "sentry", "sha": "foo", "name": "Foo <foo@example.com>"}'
+signature = hmac.new(b"k", payload, hashlib.sha256).hexdigest()
+
+
+def secret_mac():
+    return hmac.new(b"k", b"", hashlib.sha256)
+
+
+def test_valid_payload():
+    assert valid_payload(secret_mac(), payload, signature)
+    # The template MAC is copied, not consumed
+    mac = secret_mac()
+    assert valid_payload(mac, payload, signature)
+    assert valid_payload(mac, payload, signature)
+
+
+def test_invalid_payload():
+    wrong = hmac.new(b"other", payload, hashlib.sha256).hexdigest()
+    sha1 = hmac.new(b"k", payload, hashlib.sha1).hexdigest()
+    assert not valid_payload(secret_mac(), payload, wrong)
+    assert not valid_payload(secret_mac(), payload, "not hex")
+    assert not valid_payload(secret_mac(), payload, signature[:-2])
+    assert not valid_payload(secret_mac(), payload, sha1)
+    assert not valid_payload(secret_mac(), payload, "")
+
+
+def test_signature_strips_leading_prefix_only():
+    headers = {
+        "X-Hub-Signature-256": f"sha256={signature}",
+        "X-Signature": f"{signature}sha256=",
+    }
+    with app.test_request_context(headers=headers):
+        assert _signature("X-Hub-Signature-256") == signature
+        assert _signature("X-Signature") == f"{signature}sha256="
+        assert _signature("X-Missing") == ""
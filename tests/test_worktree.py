@@ -0,0 +1,66 @@
+import threading
+from unittest.mock import patch
+
+from gitbot.lib import run, worktree
+
+
+def make_checkout(tmpdir):
+    upstream = f"{tmpdir}/upstream"
+    checkout = f"{tmpdir}/checkout"
+    run(f"git init -b master {upstream}")
+    run(
+        ["git", "-c", "user.name=Test", "-c", "user.email=test@example.com"]
+        + ["commit", "--allow-empty", "-m", "Initial commit"],
+        cwd=upstream,
+    )
+    run(f"git clone {upstream} {checkout}")
+    return checkout
+
+
+def test_worktree_is_reused(tmpdir):
+    checkout = make_checkout(tmpdir)
+    with patch("gitbot.lib.WORKTREES_PATH", f"{tmpdir}/worktrees"):
+        with worktree(checkout) as first:
+            # A worktree in use is not lent out twice
+            with worktree(checkout) as second:
+                assert first != second
+        with worktree(checkout) as third:
+            assert third in (first, second)
+            run("touch dirty", cwd=third)
+            run("git add dirty", cwd=third)
+        with worktree(checkout) as fourth:
+            assert run("git status --porcelain", cwd=fourth).stdout == ""
+
+
+def test_adding_a_worktree_does_not_block_the_pool(tmpdir):
+    adding = threading.Event()
+    added = threading.Event()
+    waits = []
+
+    def fake_run(cmd, cwd="/tmp", **kwargs):
+        if isinstance(cmd, str) and cmd.startswith("git worktree add"):
+            adding.set()
+            waits.append(added.wait(timeout=5))
+
+    slow = worktree("/tmp/slow")
+    with patch("gitbot.lib.WORKTREES_PATH", str(tmpdir)), patch(
+        "gitbot.lib.run", side_effect=fake_run
+    ), patch.dict("gitbot.lib._worktrees", {"/tmp/fast": ["/tmp/fast-0"]}), patch.dict(
+        "gitbot.lib._worktrees_created"
+    ), patch.dict(
+        "gitbot.lib._worktree_add_locks"
+    ):
+        # The first borrow has to add a worktree
+        thread = threading.Thread(target=slow.__enter__)
+        thread.start()
+        assert adding.wait(timeout=5)
+
+        # Meanwhile, idle worktrees can still be borrowed
+        with worktree("/tmp/fast") as path:
+            assert path == "/tmp/fast-0"
+
+        added.set()
+        thread.join(timeout=5)
+        slow.__exit__(None, None, None)
+        # The add was still in progress while the idle worktree was borrowed
+        assert waits == [True]